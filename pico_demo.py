@@ -1,18 +1,19 @@
+import sys
 import math
+import array
 import utime
 import random
 
-def f_heart(t, noise=0):
-    x = 16*(math.sin(t))**3
-    y = 13*math.cos(t) - 5*math.cos(2*t) - 2*math.cos(3*t) - math.cos(4*t)
-    if noise != 0:
-        x += random.uniform(-noise, noise)
-        y += random.uniform(-noise, noise)
-    return x, y
-
 def f_duerer(t, noise=0):
-    x = 16*(math.sin(t))**3
-    y = 13*math.cos(t) - 5*math.cos(2*t) - 2*math.cos(3*t) - math.cos(4*t)
+    # Derive cos(2t), cos(3t), cos(4t) via the Chebyshev recurrence
+    # cos((n+1)t) = 2*cos(t)*cos(nt) - cos((n-1)t) to save trig calls
+    c = math.cos(t)
+    s = math.sin(t)
+    c2 = 2*c*c - 1
+    c3 = 2*c*c2 - c
+    c4 = 2*c*c3 - c2
+    x = 16*s*s*s
+    y = 13*c - 5*c2 - 2*c3 - c4
     if noise != 0:
         x += random.uniform(-noise, noise)
         y += random.uniform(-noise, noise)
@@ -24,18 +25,46 @@ print("x(t), y(t), x_s(t), y_s(t)")
 t_start = utime.ticks_us()
 t_last = None
 alpha = 0.1
+oma = 1 - alpha
 x_s = y_s = None
 noise = 1.5
 
+# Samples are collected in batches of K, then smoothed and printed in one go.
+# This amortizes the interpreter and print overhead over the batch.
+K = 10
+xs = array.array("f", [0]*K)
+ys = array.array("f", [0]*K)
+xs_s = array.array("f", [0]*K)
+ys_s = array.array("f", [0]*K)
+
+# Bind the output functions once to skip the attribute lookups in the loop.
+# str.format is cheaper than %-formatting in MicroPython.
+fmt = "{:.3f},{:.3f},{:.3f},{:.3f}".format
+write = sys.stdout.write
+
+# Sample at a fixed rate (50 Hz): sleep until the next deadline instead of
+# a fixed delay, so the time spent for computing and printing doesn't add up
+period_us = 20_000
+next_tick = utime.ticks_add(utime.ticks_us(), period_us)
+
 while True:
     try:
-        t = utime.ticks_us()
-        dt = utime.ticks_diff(t, t_start) / 1e6
-        x, y = f_duerer(dt, noise=noise)
-        x_s = x if x_s is None else alpha * x + (1 - alpha) * x_s
-        y_s = y if y_s is None else alpha * y + (1 - alpha) * y_s
-        print("%3f,%.3f,%.3f,%.3f" % (x, y, x_s, y_s))
-        
-        utime.sleep(0.02)
+        for i in range(K):
+            t = utime.ticks_us()
+            dt = utime.ticks_diff(t, t_start) / 1e6
+            xs[i], ys[i] = f_duerer(dt, noise=noise)
+            delay = utime.ticks_diff(next_tick, utime.ticks_us())
+            if delay > 0:
+                utime.sleep_us(delay)
+            next_tick = utime.ticks_add(next_tick, period_us)
+        if x_s is None:
+            x_s, y_s = xs[0], ys[0]
+        for i in range(K):
+            x_s = alpha * xs[i] + oma * x_s
+            y_s = alpha * ys[i] + oma * y_s
+            xs_s[i] = x_s
+            ys_s[i] = y_s
+        write("\n".join([fmt(xs[i], ys[i], xs_s[i], ys_s[i]) for i in range(K)]))
+        write("\n")
     except RuntimeError:
-        print("Retrying!")
\ No newline at end of file
+        print("Retrying!")
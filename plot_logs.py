@@ -23,18 +23,34 @@ separate terminal or within an IDE. It will plot the data in real-time.
 """
 
 
+import os
 import sys
 import time
+import threading
 import argparse
+import csv
 import numpy as np
-import pandas as pd
-from io import StringIO
 from pathlib import Path
 from collections import deque
 import matplotlib.pyplot as plt
 from matplotlib import colors as mplc
 from itertools import product, cycle
 
+try:
+    from numba import njit, prange
+except ImportError:
+    # numba is optional, fall back to plain Python
+    def njit(*args, **kwargs):
+        return lambda func: func
+    prange = range
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    # watchdog is optional, fall back to polling the log file
+    Observer = None
+
 
 def load_configs(args):
     configs = dict()
@@ -46,6 +62,7 @@ def load_configs(args):
     configs["time"] = None
     configs["rescale_speed"] = 0.1   # Controls the rescaling (range: (0, 1])
     configs["lim_margin"] = 0.05     # Controls the margin of the x-/y-axis
+    configs["poll_time"] = 1.0       # Max. time between reads (with watchdog)
     
     # Update configurations with command line arguments
     if args.file is not None:
@@ -59,6 +76,8 @@ def load_configs(args):
     
     configs["x_cols"] = args.x_cols
     configs["y_cols"] = args.y_cols
+    configs["smooth"] = args.smooth  # EMA factor for the y-values (or None)
+    configs["reference"] = args.reference
             
     palette = ["#2D8FF3", "#FC585E", "#1AAF54"]
     # https://mycolor.space / 3-color-gradient
@@ -76,20 +95,175 @@ def load_configs(args):
     return configs
 
 
-def read_data(path, n_max=100):
+# Per log file: byte offset after the last complete line and the number of
+# lines up to that offset. Used to number the rows of the tail without
+# re-reading the whole file on every update.
+_tail_state = dict()
+
+
+def read_tail(path, n_max=100):
+    # Read the header and the last n_max complete lines of the file. Only
+    # the bytes at the end of the file are read, plus the bytes appended since
+    # the previous call (to keep track of the number of lines).
+    offset, n_lines = _tail_state.get(path, (0, 0))
+    chunk = 256 * (n_max + 1)
+    with open(path, "rb") as f:
+        header = f.readline()
+        if not header.endswith(b"\n"):
+            return None, [], 0
+        f.seek(0, 2)
+        size = f.tell()
+        if size < offset:
+            # The file has been truncated, start over
+            offset, n_lines = 0, 0
+        while True:
+            start = max(0, size - chunk)
+            # Count the lines appended in front of the tail block
+            f.seek(offset)
+            while offset < start:
+                block = f.read(min(1 << 20, start - offset))
+                n_lines += block.count(b"\n")
+                offset += len(block)
+            f.seek(start)
+            buf = f.read(size - start)
+            end = buf.rfind(b"\n") + 1
+            lines = buf[:end].splitlines()
+            if start == 0 or len(lines) > n_max:
+                break
+            # Lines are longer than expected, read a larger block
+            chunk *= 2
+    n_lines += buf.count(b"\n", offset - start, end)
+    offset = max(offset, start + end)
+    _tail_state[path] = (offset, n_lines)
+    # Drop the header, or the (likely partial) first line of the block
+    lines = lines[1:]
+    lines = [line.decode("utf-8", "ignore") for line in lines[-n_max:]]
+    header = header.decode("utf-8", "ignore").rstrip("\r\n")
+    return header, lines, n_lines - 1
+
+
+@njit(cache=True)
+def ema(x, alpha, init=np.nan):
+    # Exponential moving average, continuing from the smoothed value init
+    # (starts with x[0] if init is NaN). Missing values are skipped.
+    out = np.empty(x.shape[0])
+    prev = init
+    oma = 1.0 - alpha
+    for i in range(x.shape[0]):
+        if np.isnan(prev):
+            out[i] = x[i]
+        elif np.isnan(x[i]):
+            out[i] = prev
+        else:
+            out[i] = alpha*x[i] + oma*prev
+        prev = out[i]
+    return out
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def f_duerer_vec(t):
+    # Reference curve of pico_demo.py (f_duerer), evaluated for an array t
+    x = np.empty_like(t)
+    y = np.empty_like(t)
+    for i in prange(t.shape[0]):
+        c = np.cos(t[i])
+        s = np.sin(t[i])
+        c2 = 2*c*c - 1
+        c3 = 2*c*c2 - c
+        c4 = 2*c*c3 - c2
+        x[i] = 16*s*s*s
+        y[i] = 13*c - 5*c2 - 2*c3 - c4
+    return x, y
+
+
+# Per plotted column: sample indices and smoothed values of the last update
+_smooth_state = dict()
+
+
+def smooth_column(key, index, y, alpha):
+    # Smooth y with an EMA that runs over the full log, not only over the
+    # current window: rows that have been smoothed before are reused, and
+    # only the new rows are passed through the recurrence.
+    y = y.astype(np.float64)
+    n_old = 0
+    init = np.nan
+    if key in _smooth_state:
+        prev_index, prev_y = _smooth_state[key]
+        if index[-1] < prev_index[-1]:
+            # The log has been restarted, start over
+            pass
+        elif index[0] > prev_index[-1]:
+            # No overlap with the last update, continue from its last value
+            init = prev_y[-1]
+        else:
+            n_old = np.searchsorted(index, prev_index[-1], side="right")
+            pos = np.searchsorted(prev_index, index[:n_old])
+            pos = np.minimum(pos, len(prev_index) - 1)
+            if np.array_equal(prev_index[pos], index[:n_old]):
+                init = prev_y[pos[-1]]
+            else:
+                n_old = 0
+    out = np.empty_like(y)
+    if n_old > 0:
+        out[:n_old] = prev_y[pos]
+    out[n_old:] = ema(y[n_old:], alpha, init)
+    _smooth_state[key] = (index, out)
+    return out
+
+
+# Per log file: fingerprint of the file at the last read and the result
+_data_cache = dict()
+
+
+def read_data(path, n_max=100, usecols=None):
+    # Reuse the previous result if the file has not changed since
+    st = os.stat(path)
+    fingerprint = (st.st_size, st.st_mtime_ns, n_max, usecols)
+    cached = _data_cache.get(path)
+    if cached is not None and cached[0] == fingerprint:
+        return cached[1]
+    data = parse_data(path, n_max=n_max, usecols=usecols)
+    _data_cache[path] = (fingerprint, data)
+    return data
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except ValueError:
+        return np.nan
+
+
+def to_array(values):
     try:
-        # Optimizations:
-        # - [TODO] Only read the header and the last n_max lines
-        #          https://stackoverflow.com/questions/136168/
-        #          https://stackoverflow.com/questions/17108250/
-        # - [TODO] Use the usecols argument (if x_col and y_cols are provided)
-        data = pd.read_csv(path)
-        data = data.rename(columns=lambda x: x.strip())
-    except pd.errors.EmptyDataError:
+        return np.asarray(values, dtype=np.float64)
+    except ValueError:
+        # Non-numeric values (likely an i/o error) become NaN
+        return np.array([to_float(value) for value in values])
+
+
+def parse_data(path, n_max=100, usecols=None):
+    # Returns a dict with a numpy array per column, plus the sample index
+    # in the column "_index". If usecols is given, the other columns are
+    # not converted (None), but keep their position.
+    header, lines, n_rows = read_tail(path, n_max=n_max)
+    if not lines:
         return None
-    if len(data) == 0:
+    header = [col.strip() for col in 
+              next(csv.reader([header], skipinitialspace=True))]
+    # Number the lines before skipping empty and incomplete rows, to keep
+    # the row numbers of the full log
+    first = n_rows - len(lines)
+    rows = enumerate(csv.reader(lines, skipinitialspace=True), start=first)
+    rows = deque(((i, row) for i, row in rows if len(row) == len(header)),
+                 maxlen=n_max)
+    if len(rows) == 0:
         return None
-    data = data.tail(n_max)
+    index, rows = zip(*rows)
+    data = {col: (to_array(values) if usecols is None or col in usecols 
+                  else None)
+            for col, values in zip(header, zip(*rows))}
+    data["_index"] = np.array(index)
     return data
 
 
@@ -105,13 +279,47 @@ def read_data_until(path, timeout=60, n_max=100):
             return None
         
         
+def watch_file(path, changed):
+    # Set the event whenever the file is modified. Returns the observer, or
+    # None if watchdog is not available.
+    if Observer is None:
+        return None
+    path = os.path.abspath(path)
+
+    class Handler(FileSystemEventHandler):
+        # Only react to writes, not to opening/closing the file for reading
+        def on_modified(self, event):
+            if os.path.abspath(event.src_path) == path:
+                changed.set()
+
+        def on_created(self, event):
+            self.on_modified(event)
+
+        def on_moved(self, event):
+            # The file may be replaced by moving another file in its place
+            if os.path.abspath(event.dest_path) == path:
+                changed.set()
+
+    observer = Observer()
+    observer.schedule(Handler(), os.path.dirname(path))
+    observer.daemon = True
+    observer.start()
+    return observer
+
+
+def get_columns(data):
+    # The columns of the log file
+    return [col for col in data if col != "_index"]
+
+
 def check_col(data, col, warn=True):
-    if col in data.columns:
+    columns = get_columns(data)
+    if col in columns:
         return col
     else:
         try:
-            return data.columns[int(col)]
-        except KeyError:
+            return columns[int(col)]
+        except (ValueError, IndexError):
             if warn:
                 print("Warning: Cannot find column %s" % col)
             return None
@@ -138,19 +346,58 @@ def organize_cols(data, x_cols, y_cols, warn=True):
     if x_cols is None:
         x_cols = ["_index"]
     if y_cols is None:
-        y_cols = data.columns
+        y_cols = get_columns(data)
         
     assert(len(x_cols) <= len(y_cols))
     col_pairs = list(zip(cycle(x_cols), y_cols))
-    data = data.reset_index(names="_index")
-    
-    return data, col_pairs
+    # Positions of the columns, to access them without name lookups
+    columns = list(data)
+    col_indices = [(columns.index(x_col), columns.index(y_col))
+                   for x_col, y_col in col_pairs]
+    return col_pairs, col_indices
 
 
 def get_label(x_col, y_col):
     return y_col if (x_col=="_index") else "%s vs. %s" % (x_col, y_col)
 
 
+class BlitManager:
+    # Redraws only the animated artists on top of a cached background.
+    # https://matplotlib.org/stable/users/explain/animations/blitting.html
+    def __init__(self, canvas, animated_artists=()):
+        self.canvas = canvas
+        self._bg = None
+        self._artists = []
+        for a in animated_artists:
+            self.add_artist(a)
+        # The background is refreshed whenever a full redraw happens
+        self.cid = canvas.mpl_connect("draw_event", self.on_draw)
+
+    def on_draw(self, event):
+        cv = self.canvas
+        self._bg = cv.copy_from_bbox(cv.figure.bbox)
+        self._draw_animated()
+
+    def add_artist(self, art):
+        art.set_animated(True)
+        self._artists.append(art)
+
+    def _draw_animated(self):
+        fig = self.canvas.figure
+        for a in self._artists:
+            fig.draw_artist(a)
+
+    def update(self):
+        cv = self.canvas
+        if self._bg is None:
+            self.on_draw(None)
+        else:
+            cv.restore_region(self._bg)
+            self._draw_animated()
+            cv.blit(cv.figure.bbox)
+        cv.flush_events()
+
+
 def plot_data(ax, data, col_pairs, configs):
     styles = configs["styles"]
     palette = configs["palette"]
@@ -160,19 +407,26 @@ def plot_data(ax, data, col_pairs, configs):
     for i, (x_col, y_col) in enumerate(col_pairs):
         ls, c = next(colors_styles)
         label = get_label(x_col, y_col)
-        handle = ax.plot(data[x_col].values,
-                         data[y_col].values, 
+        handle = ax.plot(data[x_col],
+                         data[y_col], 
                          color=c,
                          linestyle=ls, 
                          label=label)
         # Draw the last point as a circle
-        handle_p = ax.plot(data[x_col].values[-1],
-                           data[y_col].values[-1], 
+        handle_p = ax.plot(data[x_col][-1],
+                           data[y_col][-1], 
                            color=c, 
                            marker="o", 
                            markersize=3)
         handles[label] = handle
         handles[label+"_point"] = handle_p
+    if configs["reference"] and any(x_col == "_index" for x_col, _ in col_pairs):
+        print("Warning: --reference requires x-columns, skipping the overlay.")
+    elif configs["reference"]:
+        # Static overlay of the analytical curve of pico_demo.py
+        x_ref, y_ref = f_duerer_vec(np.linspace(0, 2*np.pi, 1000))
+        ax.plot(x_ref, y_ref, color="gray", alpha=0.5, 
+                linestyle="dotted", label="Reference")
     # Place legend outside the plot
     ax.legend(loc="upper left", bbox_to_anchor=(1.02, 1.0))
     ax.set_title("Log Visualizer", fontweight="bold")
@@ -185,57 +439,68 @@ def plot_data(ax, data, col_pairs, configs):
     return handles
 
 
-def plot_update(ax, handles, data, col_pairs, configs):
+def plot_update(ax, handles, data, col_pairs, col_indices, configs, 
+                blit_manager):
     if data is None:
         return
     max_samples = configs["max_samples"]
     rescale_speed = configs["rescale_speed"]
     lim_margin = configs["lim_margin"]
-    x_min = np.inf
-    x_max = -np.inf
-    y_min = np.inf
-    y_max = -np.inf
-    for i, (x_col, y_col) in enumerate(col_pairs):
+    smooth = configs["smooth"]
+    x_arrs = []
+    y_arrs = []
+    arrs = list(data.values())
+    index = data["_index"]
+    for (x_col, y_col), (ix, iy) in zip(col_pairs, col_indices):
         label = get_label(x_col, y_col)
-        x = data[x_col]
-        y = data[y_col]
-        if (x.dtype == "object" or y.dtype == "object"):
+        x = arrs[ix]
+        y = arrs[iy]
+        if (x.dtype.kind == "O" or y.dtype.kind == "O"):
             # Likely an i/o error
             continue
-        handles[label][0].set_ydata(y)
-        handles[label][0].set_xdata(x)
-        handles[label+"_point"][0].set_ydata(y[-1:])
-        handles[label+"_point"][0].set_xdata(x[-1:])
-        x_min = min(x_min, x.min())
-        x_max = max(x_max, x.max())
-        y_min = min(y_min, y.min())
-        y_max = max(y_max, y.max())
+        if smooth is not None:
+            y = smooth_column(label, index, y, smooth)
+        handles[label][0].set_data(x, y)
+        handles[label+"_point"][0].set_data(x[-1:], y[-1:])
+        x_arrs.append(x)
+        y_arrs.append(y)
+    x_min = y_min = np.inf
+    x_max = y_max = -np.inf
+    if x_arrs:
+        # A single reduction over all values per axis
+        x_all = np.concatenate(x_arrs)
+        y_all = np.concatenate(y_arrs)
+        x_min, x_max = np.nanmin(x_all), np.nanmax(x_all)
+        y_min, y_max = np.nanmin(y_all), np.nanmax(y_all)
     # Make this robust...
-    x_min_cur, x_max_cur = ax.get_xlim()
-    y_min_cur, y_max_cur = ax.get_ylim()
     dx = x_max - x_min
     dy = y_max - y_min
+    # Current and target limits, ordered as (x_min, x_max, y_min, y_max)
+    cur = np.array(ax.get_xlim() + ax.get_ylim())
+    ext = np.array([x_min, x_max, y_min, y_max])
+    span = np.array([dx, dx, dy, dy])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        target = ext + span*lim_margin*np.array([-1, 1, -1, 1])
+        # Relative margin between current and target limits, negative if
+        # the data exceeds the current limits
+        rel = (target - cur)*np.array([1, -1, 1, -1])/span
+        rescale = (rel > 0.2) | (rel < 0)
+        new = cur + (target - cur)*0.9
+    finite = np.isfinite(ext)
+    lims_changed = False
     # Only change the y-axis limits if they have changed 
-    if np.isfinite(y_min) and np.isfinite(y_max):
-        y_min_target = y_min - dy*lim_margin
-        y_max_target = y_max + dy*lim_margin
-        low_rel = (y_min_target - y_min_cur)/dx
-        high_rel = (y_max_cur - y_max_target)/dx
-        if (low_rel > 0.2 or low_rel < 0) or (high_rel > 0.2 or high_rel < 0):
-            ax.set_ylim((y_min_cur + (y_min_target - y_min_cur)*0.9, 
-                         y_max_cur + (y_max_target - y_max_cur)*0.9))
+    if finite[2:].all() and rescale[2:].any():
+        lims_changed = True
+        ax.set_ylim((new[2], new[3]))
     # Only change the x-axis limits if they have changed 
-    if np.isfinite(x_min) and np.isfinite(x_max):
-        x_min_target = x_min - dx*lim_margin
-        x_max_target = x_max + dx*lim_margin
-        low_rel = (x_min_target - x_min_cur)/dx
-        high_rel = (x_max_cur - x_max_target)/dx
-        
-        if (low_rel > 0.2 or low_rel < 0) or (high_rel > 0.2 or high_rel < 0):
-            #ax.set_xlim(x_min_target, x_max_target)
-            ax.set_xlim((x_min_cur + (x_min_target - x_min_cur)*0.9, 
-                         x_max_cur + (x_max_target - x_max_cur)*0.9))
-    plt.draw()
+    if finite[:2].all() and rescale[:2].any():
+        lims_changed = True
+        ax.set_xlim((new[0], new[1]))
+    if lims_changed or blit_manager is None:
+        # Full redraw, this also refreshes the background of the blit manager
+        ax.figure.canvas.draw_idle()
+    else:
+        blit_manager.update()
 
 
 def run(configs):
@@ -260,26 +525,71 @@ def run(configs):
     data = read_data_until(log_file, 
                            timeout=configs["timeout"],
                            n_max=configs["max_samples"])
-    data, col_pairs = organize_cols(data, x_cols, y_cols, warn=True)
+    # The columns are resolved only once
+    col_pairs, col_indices = organize_cols(data, x_cols, y_cols, warn=True)
+    # From now on, only convert the columns that are plotted
+    usecols = frozenset(col for pair in col_pairs for col in pair)
     handles = plot_data(ax=ax, data=data, 
                         col_pairs=col_pairs, 
                         configs=configs)
     fig.tight_layout()
+    # Only the lines and markers are redrawn on updates (blitting), if the
+    # backend supports it. Otherwise, the full figure is redrawn.
+    blit_manager = None
+    if fig.canvas.supports_blit:
+        blit_manager = BlitManager(fig.canvas, 
+                                   [h[0] for h in handles.values()])
+    # Draw the static parts (axes, legend, ...) once up front. They are only
+    # laid out again if the axis limits change.
+    fig.canvas.draw()
+
+    # Only read the log file again if it has been modified. Without watchdog,
+    # the file is polled (the fingerprint check in read_data still applies).
+    # With watchdog, the file is still read every poll_time seconds, in case
+    # no file events arrive (e.g. network shares or bind mounts).
+    changed = threading.Event()
+    changed.set()
+    observer = watch_file(log_file, changed)
 
+    data_last = None
+    last_read = 0
     while True:
-        data = read_data(log_file, 
-                         n_max=configs["max_samples"])
-        data, col_pairs = organize_cols(data, x_cols, y_cols, warn=False)
-        plot_update(ax=ax, 
-                    handles=handles, 
-                    data=data, 
-                    col_pairs=col_pairs,
-                    configs=configs)
+        now = time.time()
+        if (changed.is_set() or observer is None or 
+                now - last_read > configs["poll_time"]):
+            changed.clear()
+            last_read = now
+            data = read_data(log_file, 
+                             n_max=configs["max_samples"],
+                             usecols=usecols)
+            # Skip the update if the log file has not changed
+            if data is not data_last:
+                data_last = data
+                plot_update(ax=ax, 
+                            handles=handles, 
+                            data=data, 
+                            col_pairs=col_pairs,
+                            col_indices=col_indices,
+                            configs=configs,
+                            blit_manager=blit_manager)
         plt.pause(configs["sleep_time"])
         # Check if fig is still alive...
         if not plt.fignum_exists(fig.number):
             break
 
+    if observer is not None:
+        observer.stop()
+        observer.join()
+
+def smoothing_factor(value):
+    # argparse type for --smooth: a float in (0, 1]
+    alpha = float(value)
+    if not 0 < alpha <= 1:
+        raise argparse.ArgumentTypeError("ALPHA must be in (0, 1], got %s" 
+                                         % value)
+    return alpha
+
+
 def run_args(args):
     configs = load_configs(args)
     run(configs)
@@ -305,6 +615,13 @@ if __name__ == "__main__":
                               "If not provided, the sample index will be used. "
                               "If multiple columns are provided, it must match "
                               "the number of y-columns."))
+    parser.add_argument("--smooth", type=smoothing_factor, default=None, metavar="ALPHA",
+                        help=("Smooth the y-values with an exponential moving "
+                              "average with factor ALPHA in (0, 1]. "
+                              "Uses numba if available."))
+    parser.add_argument("--reference", action="store_true",
+                        help=("Overlay the analytical curve of pico_demo.py. "
+                              "Use with --x-col 0 --y-col 1 (or 2 and 3)."))
     args = parser.parse_args()
     run_args(args)
     